@@ -1,40 +1,108 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
+import numpy as np
 import folium
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
-import math
 import base64
 import os
+import threading
 
 # --- Configuration ---
 DB_PATH = "grandir.db"
 PARIS_COORDS = [48.8566, 2.3522]
 DEFAULT_ZOOM = 12
+CARDS_PER_PAGE = 20
+HISTORY_LIMIT = 50  # most recent other applications listed and mapped per card
+EARTH_RADIUS_KM = 6371
+
+# Urgency levels stored in fact_postings for each map color
+URGENCY_LEVELS = {
+    'red': ('Rouge', 'Red'),
+    'orange': ('Orange',),
+    'green': ('Verte', 'Green'),
+}
+
+# Leaflet callback turning one [lat, lon, color, popup, tooltip] row into a nursery marker
+NURSERY_MARKER_JS = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({
+        markerColor: row[2], iconColor: 'white', icon: 'info-sign', prefix: 'glyphicon'
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[3]);
+    marker.bindTooltip(row[4]);
+    return marker;
+}
+"""
 
 # --- Helper Functions ---
 
+@st.cache_resource
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    """Opens the SQLite connection once per process; it is reused by every rerun and session."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL lets reads proceed during a status update; a 64 MB page cache keeps hot tables in memory.
+    # With WAL, synchronous=NORMAL only fsyncs at checkpoints, and mmap serves reads without copies
+    conn.executescript("""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+    """)
     return conn
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculates Haversine distance in km."""
-    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
-        return None
-    R = 6371  # Earth radius in km
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def display_pdf(file_path):
-    """Generates an iframe to display a PDF."""
+@st.cache_resource
+def get_db_write_lock():
+    """Lock serializing writes on the shared connection across session threads."""
+    # Cached like the connection: a plain module global would be recreated on every script rerun
+    return threading.Lock()
+
+def fetch_df(query, conn, params=()):
+    """Runs a parametric query and builds the DataFrame straight from the cursor rows."""
+    # conn.execute reuses sqlite3's compiled-statement cache; read_sql_query adds its own setup on top
+    cur = conn.execute(query, params)
+    columns = [d[0] for d in cur.description]
+    return pd.DataFrame.from_records(cur.fetchall(), columns=columns, coerce_float=True)
+
+@st.cache_resource
+def ensure_indexes():
+    """Creates the indexes the dashboard queries rely on (idempotent, runs once per process)."""
+    conn = get_db_connection()
+    # Lookups by candidate_id already use the UNIQUE (candidate_id, posting_id) autoindex
+    indexes = {
+        "idx_postings_nursery_role": "CREATE INDEX idx_postings_nursery_role ON fact_postings(nursery_id, role_id, status)",
+        "idx_applications_posting": "CREATE INDEX idx_applications_posting ON fact_applications(posting_id)",
+    }
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    missing = [ddl for name, ddl in indexes.items() if name not in existing]
+    # Nothing to create means nothing to analyze: skip the write to the database file
+    if not missing:
+        return
+    with get_db_write_lock(), conn:
+        for ddl in missing:
+            conn.execute(ddl)
+        # Refresh planner statistics so the new indexes are actually picked
+        conn.execute("ANALYZE")
+
+def haversine_from_radians(phi1, cos_phi1, lambda1, phi2, lambda2):
+    """Haversine distance in km from a point in radians whose cos(latitude) is precomputed."""
+    a = np.sin((phi2 - phi1) / 2)**2 + cos_phi1 * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2)**2
+    # Rounding can push a a hair above 1 for near-antipodal points, where arcsin would return NaN
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+@st.cache_data(ttl=600, max_entries=32)
+def load_cv(file_path, modified):
+    """Reads a CV file; `modified` (its mtime) is part of the cache key so a replaced file is re-read."""
     with open(file_path, "rb") as f:
-        base64_pdf = base64.b64encode(f.read()).decode('utf-8')
+        return f.read()
+
+def display_pdf(pdf_bytes):
+    """Generates an iframe to display a PDF."""
+    base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
     pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="1000" type="application/pdf"></iframe>'
     return pdf_display
 
@@ -42,73 +110,128 @@ def display_pdf(file_path):
 def load_nurseries_map_data(revision):
     """Loads nursery data for the main map."""
     conn = get_db_connection()
+    # Postings and applications are rolled up per nursery first, so the final join
+    # is one row per nursery instead of the postings x applications product
     query = """
+    WITH urgency AS (
+        SELECT
+            nursery_id,
+            MAX(
+                CASE 
+                    WHEN urgency_level IN ('Rouge', 'Red') THEN 3
+                    WHEN urgency_level IN ('Orange') THEN 2
+                    WHEN urgency_level IN ('Verte', 'Green') THEN 1
+                    ELSE 0
+                END
+            ) as max_urgency_score
+        FROM fact_postings
+        WHERE status = 'Open'
+        GROUP BY nursery_id
+    ), apps AS (
+        SELECT p.nursery_id, COUNT(*) as application_count
+        FROM fact_applications a
+        JOIN fact_postings p ON a.posting_id = p.posting_id
+        GROUP BY p.nursery_id
+    )
     SELECT 
         n.nursery_id,
         n.nursery_name,
         n.latitude,
         n.longitude,
-        MAX(
-            CASE 
-                WHEN p.status = 'Open' AND p.urgency_level IN ('Rouge', 'Red') THEN 3
-                WHEN p.status = 'Open' AND p.urgency_level IN ('Orange') THEN 2
-                WHEN p.status = 'Open' AND p.urgency_level IN ('Verte', 'Green') THEN 1
-                ELSE 0
-            END
-        ) as max_urgency_score,
-        COUNT(DISTINCT a.application_id) as application_count
+        COALESCE(u.max_urgency_score, 0) as max_urgency_score,
+        COALESCE(ap.application_count, 0) as application_count,
+        CASE COALESCE(u.max_urgency_score, 0)
+            WHEN 3 THEN 'red'
+            WHEN 2 THEN 'orange'
+            WHEN 1 THEN 'green'
+            ELSE 'gray'
+        END as color
     FROM dim_nurseries n
-    LEFT JOIN fact_postings p ON n.nursery_id = p.nursery_id
-    LEFT JOIN fact_applications a ON p.posting_id = a.posting_id
+    LEFT JOIN urgency u ON n.nursery_id = u.nursery_id
+    LEFT JOIN apps ap ON n.nursery_id = ap.nursery_id
     WHERE n.latitude IS NOT NULL AND n.longitude IS NOT NULL
-    GROUP BY n.nursery_id
+    ORDER BY n.nursery_id
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    df = fetch_df(query, conn)
     
     # --- JITTER LOGIC ---
     # We apply a deterministic jitter based on nursery_id to separate overlapping markers.
     # 0.002 degrees is roughly 200 meters, ensuring clear separation.
-    def apply_jitter(row):
-        # Pseudo-random but deterministic shift based on ID
-        import hashlib
-        h = hashlib.md5(str(row['nursery_id']).encode()).hexdigest()
-        # Take partial hash to create offset between -0.004 and +0.004
-        lat_offset = (int(h[0:4], 16) / 65535 - 0.5) * 0.008
-        lon_offset = (int(h[4:8], 16) / 65535 - 0.5) * 0.008
-        return pd.Series([row['latitude'] + lat_offset, row['longitude'] + lon_offset])
-    
-    # Apply to all rows
     if not df.empty:
-        df[['latitude', 'longitude']] = df.apply(apply_jitter, axis=1)
+        # Pseudo-random but deterministic shift based on ID: splitmix64 mixer over the whole column
+        h = df['nursery_id'].to_numpy().astype(np.uint64)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        h ^= h >> np.uint64(31)
+        # Take 16-bit slices of the hash to create offset between -0.004 and +0.004
+        lat_offset = ((h & np.uint64(0xFFFF)).astype(float) / 65535 - 0.5) * 0.008
+        lon_offset = (((h >> np.uint64(16)) & np.uint64(0xFFFF)).astype(float) / 65535 - 0.5) * 0.008
+        df['latitude'] = df['latitude'] + lat_offset
+        df['longitude'] = df['longitude'] + lon_offset
 
-    def score_to_color(score):
-        if score == 3: return 'red'
-        if score == 2: return 'orange'
-        if score == 1: return 'green'
-        return 'gray'
-        
-    df['color'] = df['max_urgency_score'].apply(score_to_color)
+    # Color comes from SQL; as a categorical, the map filter compares small integer codes
+    df['color'] = pd.Categorical(df['color'], categories=['red', 'orange', 'green', 'gray'])
+    # Ids, scores and counts fit in small integers. Coordinates stay float64: they are the
+    # keys map clicks are matched on, and float32 would not round-trip through the browser
+    df = df.astype({'nursery_id': 'int32', 'max_urgency_score': 'int8', 'application_count': 'int32'})
     return df
 
+@st.cache_data(ttl=600)
+def load_nursery_marker_arrays(revision):
+    """Returns the map marker fields as parallel NumPy arrays, with popup and tooltip text prebuilt."""
+    df_nurseries = load_nurseries_map_data(revision)
+    names = df_nurseries['nursery_name']
+    counts = df_nurseries['application_count'].astype(str)
+    return {
+        'latitude': df_nurseries['latitude'].to_numpy(),
+        'longitude': df_nurseries['longitude'].to_numpy(),
+        'color': df_nurseries['color'].to_numpy(dtype=object),
+        'application_count': df_nurseries['application_count'].to_numpy(),
+        'popup': ("<b>" + names + "</b><br>Apps: " + counts).to_numpy(dtype=object),
+        'tooltip': (names + " (" + counts + " apps)").to_numpy(dtype=object),
+    }
+
+@st.cache_data(ttl=600)
+def get_map_markers(selected_colors, show_apps_only, revision):
+    """Returns [lat, lon, color, popup, tooltip] rows for the nurseries matching the map filters."""
+    markers = load_nursery_marker_arrays(revision)
+
+    # Apply Filters as one boolean mask over the arrays
+    mask = np.isin(markers['color'], list(selected_colors))
+    if show_apps_only:
+        mask &= markers['application_count'] > 0
+
+    return list(zip(
+        markers['latitude'][mask].tolist(), markers['longitude'][mask].tolist(),
+        markers['color'][mask].tolist(), markers['popup'][mask].tolist(), markers['tooltip'][mask].tolist()
+    ))
+
+@st.cache_data(ttl=600)
+def get_nursery_coord_index(revision):
+    """Maps the (rounded) jittered marker coordinates to nursery_id, for resolving map clicks."""
+    df_nurseries = load_nurseries_map_data(revision)
+    keys = zip(df_nurseries['latitude'].round(4), df_nurseries['longitude'].round(4))
+    return dict(zip(keys, df_nurseries['nursery_id'].tolist()))
+
+@st.cache_data(ttl=600)
 def get_nursery_details(nursery_id):
     conn = get_db_connection()
     query = "SELECT * FROM dim_nurseries WHERE nursery_id = ?"
     # Ensure int for sqlite
-    df = pd.read_sql_query(query, conn, params=(int(nursery_id),))
-    conn.close()
+    df = fetch_df(query, conn, params=(int(nursery_id),))
     return df.iloc[0] if not df.empty else None
 
+@st.cache_data(ttl=600)
 def get_active_roles(nursery_id):
     conn = get_db_connection()
     query = """
-    SELECT DISTINCT r.role_id, r.role_name
+    SELECT r.role_id, r.role_name
     FROM fact_postings p
     JOIN dim_roles r ON p.role_id = r.role_id
     WHERE p.nursery_id = ? AND p.status = 'Open'
+    GROUP BY r.role_id
     """
-    df = pd.read_sql_query(query, conn, params=(int(nursery_id),))
-    conn.close()
+    df = fetch_df(query, conn, params=(int(nursery_id),))
     return df
 
 @st.cache_data(ttl=600)
@@ -116,7 +239,15 @@ def get_candidates_for_position(nursery_id, role_id, revision):
     conn = get_db_connection()
     query = """
     SELECT 
-        c.*, 
+        c.candidate_id,
+        c.first_name,
+        c.last_name,
+        c.email,
+        c.phone,
+        c.latitude,
+        c.longitude,
+        c.cv_filename,
+        c.ai_summary,
         a.application_id,
         a.current_status,
         a.match_score,
@@ -129,63 +260,100 @@ def get_candidates_for_position(nursery_id, role_id, revision):
     ORDER BY a.match_score DESC
     """ 
     
-    df = pd.read_sql_query(query, conn, params=(int(nursery_id), int(role_id)))
-    conn.close()
-    return df
+    df = fetch_df(query, conn, params=(int(nursery_id), int(role_id)))
+    # Scores and distances only need single precision; halves the cached frame's numeric columns
+    return df.astype({'match_score': 'float32', 'distance_km': 'float32'})
 
-def get_better_opportunity(candidate_lat, candidate_lon, target_dist, role_id):
-    """Finds the SINGLE CLOSEST nursery with SAME role OPEN that is CLOSER than target_dist."""
+@st.cache_data(ttl=600)
+def load_open_nurseries_by_role():
+    """Returns {role_id: dict of arrays} for the nurseries with an open posting for each role."""
     conn = get_db_connection()
-    # Get all nurseries with open posting for this role
     query = """
-    SELECT DISTINCT n.nursery_id, n.nursery_name, n.latitude, n.longitude
+    SELECT p.role_id, n.nursery_id, n.nursery_name, n.latitude, n.longitude
     FROM fact_postings p
     JOIN dim_nurseries n ON p.nursery_id = n.nursery_id
-    WHERE p.role_id = ? AND p.status = 'Open' AND n.latitude IS NOT NULL
+    WHERE p.status = 'Open' AND n.latitude IS NOT NULL AND n.longitude IS NOT NULL
+    GROUP BY p.role_id, n.nursery_id
+    ORDER BY p.role_id, n.nursery_id
     """
-    df_others = pd.read_sql_query(query, conn, params=(int(role_id),))
-    conn.close()
-    
-    opportunities = []
-    for _, row in df_others.iterrows():
-        dist = haversine_distance(candidate_lat, candidate_lon, row['latitude'], row['longitude'])
-        if dist is not None and dist < target_dist:
-             opportunities.append({
-                 'nursery_name': row['nursery_name'],
-                 'latitude': row['latitude'],
-                 'longitude': row['longitude'],
-                 'distance': dist
-             })
-             
-    # Sort by distance (asc) and take the first one (closest)
-    if opportunities:
-        opportunities.sort(key=lambda x: x['distance'])
-        return opportunities[0] # Return the single best opportunity
-    return None
+    df = fetch_df(query, conn)
+    # One array per field (not one record per nursery), with the radians the distance maths needs
+    return {
+        int(role_id): {
+            'names': group['nursery_name'].to_numpy(),
+            'latitudes': group['latitude'].to_numpy(dtype=float),
+            'longitudes': group['longitude'].to_numpy(dtype=float),
+            'phis': np.radians(group['latitude'].to_numpy(dtype=float)),
+            'lambdas': np.radians(group['longitude'].to_numpy(dtype=float)),
+        }
+        for role_id, group in df.groupby('role_id')
+    }
+
+@st.cache_data(ttl=600)
+def get_better_opportunity(candidate_lat, candidate_lon, target_dist, role_id):
+    """Finds the SINGLE CLOSEST nursery with SAME role OPEN that is CLOSER than target_dist."""
+    # Nurseries with this role open, loaded once for all candidates
+    others = load_open_nurseries_by_role().get(int(role_id))
+    if others is None:
+        return None
+
+    phis, lambdas = others['phis'], others['lambdas']
+    # Candidate trig is computed once and shared by both distance passes
+    phi1, lambda1 = np.radians(candidate_lat), np.radians(candidate_lon)
+    cos_phi1 = np.cos(phi1)
+
+    # Most nurseries are far away: drop them with the cheap equirectangular
+    # approximation (well under 1% off at these ranges, so a 5% margin is safe)
+    approx = EARTH_RADIUS_KM * np.hypot((lambdas - lambda1) * cos_phi1, phis - phi1)
+    near = approx <= target_dist * 1.05
+
+    # Exact haversine only for the survivors
+    distances = np.full(len(phis), np.inf)
+    distances[near] = haversine_from_radians(phi1, cos_phi1, lambda1, phis[near], lambdas[near])
+    # target_dist is itself a stored haversine result, so the applied-to nursery can come out a
+    # rounding error below it; require at least 1 m of improvement to count as closer
+    distances = np.where(distances < target_dist - 1e-3, distances, np.inf)
+
+    # Take the single closest one
+    best = int(np.argmin(distances))
+    if np.isinf(distances[best]):
+        return None
+    return {
+        'nursery_name': others['names'][best],
+        'latitude': float(others['latitudes'][best]),
+        'longitude': float(others['longitudes'][best]),
+        'distance': float(distances[best])
+    }
 
 @st.cache_data(ttl=600)
-def get_application_history(candidate_id, current_nursery_id, revision):
+def get_application_histories(candidate_ids, revision):
+    """Fetches the applications of all given candidates in one query; returns {candidate_id: DataFrame}."""
     conn = get_db_connection()
-    query = """
-    SELECT DISTINCT n.nursery_name, n.latitude, n.longitude, r.role_name, a.current_status, a.application_date
+    placeholders = ','.join(['?'] * len(candidate_ids))
+    query = f"""
+    SELECT DISTINCT a.candidate_id, n.nursery_id, n.nursery_name, n.latitude, n.longitude, r.role_name, a.current_status, a.application_date
     FROM fact_applications a
     JOIN fact_postings p ON a.posting_id = p.posting_id
     JOIN dim_nurseries n ON p.nursery_id = n.nursery_id
     JOIN dim_roles r ON p.role_id = r.role_id
-    WHERE a.candidate_id = ? AND n.nursery_id != ?
+    WHERE a.candidate_id IN ({placeholders})
+    ORDER BY a.candidate_id, a.application_date DESC
     """
-    df = pd.read_sql_query(query, conn, params=(int(candidate_id), int(current_nursery_id)))
-    conn.close()
-    return df
+    df = fetch_df(query, conn, params=[int(c) for c in candidate_ids])
+    groups = dict(list(df.drop(columns='candidate_id').groupby(df['candidate_id'])))
+    empty = df.drop(columns='candidate_id').iloc[0:0]
+    return {c: groups.get(c, empty) for c in candidate_ids}
 
 def update_application_status(application_id, new_status):
     conn = get_db_connection()
-    conn.execute(
-        "UPDATE fact_applications SET current_status = ?, last_update_date = CURRENT_TIMESTAMP WHERE application_id = ?",
-        (new_status, int(application_id))
-    )
-    conn.commit()
-    conn.close()
+    # The connection is shared by every session: hold the write lock so one session's
+    # commit or rollback cannot end a transaction another session is still in.
+    # `with conn` commits on success, rolls back if the update fails
+    with get_db_write_lock(), conn:
+        conn.execute(
+            "UPDATE fact_applications SET current_status = ?, last_update_date = CURRENT_TIMESTAMP WHERE application_id = ?",
+            (new_status, int(application_id))
+        )
     # Increment revision to invalidate cache
     if 'data_revision' in st.session_state:
         st.session_state['data_revision'] += 1
@@ -193,35 +361,25 @@ def update_application_status(application_id, new_status):
 @st.cache_data(ttl=600)
 def get_all_applications_ranked(selected_urgency_colors, revision):
     conn = get_db_connection()
-    # Build dynamic placeholders for IN clause
-    placeholders = ','.join(['?'] * len(selected_urgency_colors))
-    
-    # Map colors to urgency levels (if needed) or assuming colors match logic
-    # In load_nurseries_map_data we had: Red/Rouge, Orange, Green/Verte.
-    # We should probably filter by the color logic.
-    # Simpler approach: Fetch all open applications and filter in pandas or improved SQL?
-    # Let's align with the map logic: 
-    # Red -> ('Rouge', 'Red')
-    # Orange -> ('Orange')
-    # Green -> ('Verte', 'Green')
-    
-    urgency_filters = []
-    params = []
-    
-    if 'red' in selected_urgency_colors:
-        urgency_filters.append("p.urgency_level IN ('Rouge', 'Red')")
-    if 'orange' in selected_urgency_colors:
-        urgency_filters.append("p.urgency_level = 'Orange'")
-    if 'green' in selected_urgency_colors:
-        urgency_filters.append("p.urgency_level IN ('Verte', 'Green')")
-        
-    where_clause = " OR ".join(urgency_filters)
-    if not where_clause:
+    # Map colors to the urgency levels used by the map logic, then filter with one IN set
+    urgency_levels = [level for color in selected_urgency_colors for level in URGENCY_LEVELS.get(color, ())]
+    if urgency_levels:
+        placeholders = ','.join(['?'] * len(urgency_levels))
+        where_clause = f"p.urgency_level IN ({placeholders})"
+    else:
         where_clause = "1=0" # Select nothing if no colors
         
     query = f"""
     SELECT 
-        c.*, 
+        c.candidate_id,
+        c.first_name,
+        c.last_name,
+        c.email,
+        c.phone,
+        c.latitude,
+        c.longitude,
+        c.cv_filename,
+        c.ai_summary,
         a.application_id,
         a.current_status,
         a.match_score,
@@ -243,17 +401,78 @@ def get_all_applications_ranked(selected_urgency_colors, revision):
     ORDER BY a.match_score DESC
     """
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    df = fetch_df(query, conn, params=urgency_levels)
+    return df.astype({'match_score': 'float32', 'distance_km': 'float32'})
+
+def paginate(df, key):
+    """Returns the page of df picked by the user, so only CARDS_PER_PAGE cards are rendered per run."""
+    n_pages = -(-len(df) // CARDS_PER_PAGE)
+    if n_pages <= 1:
+        return df
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key=key)
+    start = (page - 1) * CARDS_PER_PAGE
+    st.caption(f"Showing {start + 1}-{min(start + CARDS_PER_PAGE, len(df))} of {len(df)}")
+    return df.iloc[start:start + CARDS_PER_PAGE]
+
+def with_display_values(df):
+    """Adds the rounded score and distance shown on the cards, computed for the whole page at once."""
+    # float64 first: rounding the float32 columns would leave e.g. 7.300000190734863
+    return df.assign(
+        match_score_r=df['match_score'].astype(float).fillna(0).round(1),
+        distance_r=df['distance_km'].astype(float).fillna(0).round(1),
+    )
+
+def build_logistics_map(cand_lat, cand_lon, nurs_lat, nurs_lon, nurs_name, history_points, better_opp):
+    """Builds a candidate's logistics map: home, target nursery, other applications and the better opportunity."""
+    viz_map = folium.Map(location=[cand_lat, cand_lon], zoom_start=11)
+
+    # 1. Blue: Candidate
+    folium.Marker(
+        [cand_lat, cand_lon], 
+        tooltip="Candidate Home",
+        icon=folium.Icon(color='blue', icon='user', prefix='fa')
+    ).add_to(viz_map)
+
+    # 2. Red: Target Nursery
+    folium.Marker(
+        [nurs_lat, nurs_lon],
+        tooltip=f"Target: {nurs_name}",
+        icon=folium.Icon(color='red', icon='star', prefix='fa')
+    ).add_to(viz_map)
+
+    # 3. Gray: History, as (latitude, longitude, nursery_name) points
+    for lat, lon, name in history_points:
+        folium.Marker(
+            [lat, lon],
+            tooltip=f"Applied: {name}",
+            icon=folium.Icon(color='gray', icon='history', prefix='fa')
+        ).add_to(viz_map)
 
-def display_candidate_card(cand, nursery_context):
+    # 4. Green: Better Opportunity (Single Closest)
+    if better_opp:
+        folium.Marker(
+            [better_opp['latitude'], better_opp['longitude']],
+            tooltip=f"Better Opportunity: {better_opp['nursery_name']} ({round(better_opp['distance'], 1)} km)",
+            icon=folium.Icon(color='green', icon='thumbs-up', prefix='fa')
+        ).add_to(viz_map)
+
+    return viz_map
+
+@st.cache_data(ttl=600, max_entries=256)
+def render_logistics_map_html(cand_lat, cand_lon, nurs_lat, nurs_lon, nurs_name, history_points, better_opp):
+    """Renders a logistics map to standalone HTML, cached on its marker inputs."""
+    return build_logistics_map(
+        cand_lat, cand_lon, nurs_lat, nurs_lon, nurs_name, history_points, better_opp
+    ).get_root().render()
+
+def display_candidate_card(cand, nursery_context, history):
     """
     Reusable component to display a candidate card.
-    cand: Series/Dict with candidate info + app info
+    cand: Dict with candidate info + app info (with the with_display_values columns)
     nursery_context: Dict with 'nursery_name', 'latitude', 'longitude', 'nursery_id' (if available)
+    history: DataFrame of all the candidate's applications (from get_application_histories)
     """
-    score = round(cand['match_score'], 1) if cand['match_score'] else 0
+    score = cand['match_score_r']
     
     # Header format depends on context
     # If Global List, show Role & Nursery in header
@@ -262,7 +481,16 @@ def display_candidate_card(cand, nursery_context):
     else:
         header_text = f"{cand['first_name']} {cand['last_name']} - Match: {score}/10"
 
-    with st.expander(header_text):
+    # Tracking the open state makes the expander lazy: a collapsed card renders only its header
+    card = st.expander(header_text, key=f"card_{cand['application_id']}", on_change="rerun")
+    with card:
+        if not card.open:
+            return
+
+        # Other applications, shared by the profile list and the logistics map:
+        # exclude the nursery this card is shown for and keep the most recent ones
+        history = history[history['nursery_id'] != nursery_context.get('nursery_id', 0)].head(HISTORY_LIMIT)
+
         col1, col2 = st.columns([1, 2])
         
         # Column 1: Profile
@@ -288,7 +516,7 @@ def display_candidate_card(cand, nursery_context):
 
             st.markdown(f"**Email:** {cand['email']}")
             st.markdown(f"**Phone:** {cand['phone']}")
-            st.markdown(f"**Distance:** {round(cand.get('distance_km', 0) or 0, 1)} km")
+            st.markdown(f"**Distance:** {cand['distance_r']} km")
             st.metric("Match Score", f"{score}/10")
             
             # Prerequisites Indicator
@@ -303,13 +531,6 @@ def display_candidate_card(cand, nursery_context):
                 st.text("No AI Summary available.")
                 
             # Other Applications (Grouped by Status)
-            # Use nursery_id from context for exclusion
-            nursery_id_for_query = nursery_context.get('nursery_id', 0) 
-            # If global list, cand['nursery_id'] might not be passed directly in nursery_context if it varies
-            # But the query uses params. Let's rely on what we have.
-            # History
-            nursery_id_for_query = nursery_context.get('nursery_id', 0)
-            history = get_application_history(cand['candidate_id'], nursery_id_for_query, st.session_state['data_revision'])
             if not history.empty:
                 st.divider()
                 st.markdown("**Prior Applications**")
@@ -317,9 +538,9 @@ def display_candidate_card(cand, nursery_context):
                 status_groups = history.groupby('current_status')
                 for status, group in status_groups:
                     st.caption(f"**Stage: {status}**")
-                    for _, app in group.iterrows():
-                        st.markdown(f"- **{app['role_name']}** @ {app['nursery_name']}")
-                        st.caption(f"Date: {app['application_date']}")
+                    for app in group.itertuples(index=False):
+                        st.markdown(f"- **{app.role_name}** @ {app.nursery_name}")
+                        st.caption(f"Date: {app.application_date}")
             else:
                 st.divider()
                 st.caption("No prior applications found.")
@@ -336,70 +557,19 @@ def display_candidate_card(cand, nursery_context):
             nurs_name = nursery_context.get('nursery_name') or cand.get('nursery_name')
             
             if cand_lat and cand_lon and nurs_lat and nurs_lon:
-                viz_map = folium.Map(location=[cand_lat, cand_lon], zoom_start=11)
-                
-                # 1. Blue: Candidate
-                folium.Marker(
-                    [cand_lat, cand_lon], 
-                    tooltip="Candidate Home",
-                    icon=folium.Icon(color='blue', icon='user', prefix='fa')
-                ).add_to(viz_map)
-                
-                # 2. Red: Target Nursery
-                folium.Marker(
-                    [nurs_lat, nurs_lon],
-                    tooltip=f"Target: {nurs_name}",
-                    icon=folium.Icon(color='red', icon='star', prefix='fa')
-                ).add_to(viz_map)
-                
-                # 3. Gray: History
-                # (Already fetched above, reuse?)
-                for _, hist in history.iterrows():
-                     folium.Marker(
-                        [hist['latitude'], hist['longitude']],
-                        tooltip=f"Applied: {hist['nursery_name']}",
-                        icon=folium.Icon(color='gray', icon='history', prefix='fa')
-                    ).add_to(viz_map)
-
-                # 4. Green: Better Opportunity (Single Closest)
-                # Need role_id. 
-                # In Map View: selected_role_id available? No, passed via context? 
-                # Wait, get_candidates_for_position returns joined columns. Does it select role_id?
-                # get_candidates_for_position query: "SELECT c.*, a.application_id..." 
-                # It does NOT explicitly select role_id from postings.
-                # However, for Map View, we KNOW the role_id because we selected it in the UI (selected_role_id).
-                # For Global View, we updated the query to include p.role_id.
-                
-                role_id_for_opp = cand.get('role_id')
-                # Fallback for Map View if 'role_id' not in cand (it might not be in get_candidates_for_position DF yet)
-                # Actually, in Map View calling display_candidate_card, we know the role logic.
-                # Let's rely on cand['role_id'] being present. 
-                # If it's missing in Map View's DF, we must ensure it's there.
-                # get_candidates_for_position logic:
-                # "SELECT c.*, ... FROM fact_applications a JOIN dim_candidates c ... JOIN fact_postings p ..."
-                # We should add p.role_id to that query too if we want to be safe, OR pass it in context.
-                # But wait, looking at lines 460+, we have `selected_role_id`.
-                # Let's try to grab it from cand first.
-                
-                if not role_id_for_opp and 'role_id' in nursery_context:
-                     role_id_for_opp = nursery_context['role_id']
-                
-                # If we still don't have it (e.g. Map View DF didn't have it and context didn't have it), we can't show opps.
-                # NOTE: We need to ensure get_candidates_for_position includes role_id or we pass it.
-                # I will assume we might need to patch get_candidates_for_position OR pass it in context.
-                # Let's pass it in context in the main loop to be safe.
-                
+                # Better Opportunity needs the role: global rows carry role_id, the dashboard passes it in context
+                role_id_for_opp = cand.get('role_id') or nursery_context.get('role_id')
+                better_opp = None
                 if role_id_for_opp and cand.get('distance_km'):
-                     better_opp = get_better_opportunity(cand_lat, cand_lon, cand['distance_km'], role_id_for_opp)
-                     
-                     if better_opp:
-                         folium.Marker(
-                            [better_opp['latitude'], better_opp['longitude']],
-                            tooltip=f"Better Opportunity: {better_opp['nursery_name']} ({round(better_opp['distance'], 1)} km)",
-                            icon=folium.Icon(color='green', icon='thumbs-up', prefix='fa') # changed icon
-                        ).add_to(viz_map)
-                
-                st_folium(viz_map, width="100%", height=300, key=f"map_{cand['application_id']}") # Use app_id for unique key
+                    better_opp = get_better_opportunity(cand_lat, cand_lon, float(cand['distance_km']), role_id_for_opp)
+
+                map_html = render_logistics_map_html(
+                    cand_lat, cand_lon, nurs_lat, nurs_lon, nurs_name,
+                    tuple(history[['latitude', 'longitude', 'nursery_name']].itertuples(index=False, name=None)),
+                    better_opp
+                )
+                # Display only: a plain iframe has no st_folium state round-trip, so it never reruns the script
+                st.iframe(map_html, height=300)
             else:
                 st.warning("Location data missing for map.")
 
@@ -409,21 +579,62 @@ def display_candidate_card(cand, nursery_context):
         
         if cv_path and os.path.exists(cv_path):
             if st.checkbox("View CV", key=f"show_cv_{cand['application_id']}"):
-                with open(cv_path, "rb") as pdf_file:
-                    st.download_button(
-                        label="Download CV",
-                        data=pdf_file,
-                        file_name=cand['cv_filename'],
-                        mime='application/pdf',
-                        key=f"dl_{cand['application_id']}"
-                    )
-                pdf_html = display_pdf(cv_path)
+                # One cached read feeds both the download button and the inline viewer
+                pdf_bytes = load_cv(cv_path, os.path.getmtime(cv_path))
+                st.download_button(
+                    label="Download CV",
+                    data=pdf_bytes,
+                    file_name=cand['cv_filename'],
+                    mime='application/pdf',
+                    key=f"dl_{cand['application_id']}"
+                )
+                pdf_html = display_pdf(pdf_bytes)
                 st.markdown(pdf_html, unsafe_allow_html=True)
         else:
             st.warning(f"CV file not found: {cand.get('cv_filename', 'Unknown')}")
 
 # --- Main App ---
 
+@st.fragment
+def render_nursery_dashboard(nursery_id):
+    """Recruitment dashboard for one nursery. Runs as a fragment, so its widgets only rerun this section."""
+    nursery_data = get_nursery_details(nursery_id)
+
+    st.divider()
+    st.divider()
+    st.header(f"Recruitment Dashboard: {nursery_data['nursery_name']}")
+
+    # Position Filter
+    active_roles = get_active_roles(nursery_id)
+    if active_roles.empty:
+        st.warning("No active job postings for this nursery.")
+    else:
+        role_options = dict(zip(active_roles['role_name'], active_roles['role_id']))
+        selected_role_name = st.selectbox("Select Position", options=list(role_options.keys()))
+        selected_role_id = role_options[selected_role_name]
+
+        # Candidate List
+        candidates = get_candidates_for_position(nursery_id, selected_role_id, st.session_state['data_revision'])
+
+        if candidates.empty:
+            st.info("No candidates found for this position.")
+        else:
+            st.subheader(f"Candidates ({len(candidates)})")
+
+            page = with_display_values(paginate(candidates, key=f"page_{nursery_id}_{selected_role_id}"))
+            histories = get_application_histories(tuple(page['candidate_id'].tolist()), st.session_state['data_revision'])
+            # Plain dicts per row: cheaper than iterrows' Series and keep the cand.get() API of the card
+            for cand in page.to_dict('records'):
+                # Pass context
+                nursery_context = {
+                    'nursery_id': nursery_id,
+                    'nursery_name': nursery_data['nursery_name'],
+                    'latitude': nursery_data['latitude'],
+                    'longitude': nursery_data['longitude'],
+                    'role_id': selected_role_id # Pass role_id for Map View context
+                }
+                display_candidate_card(cand, nursery_context, histories[cand['candidate_id']])
+
 def main():
     st.set_page_config(page_title="Grandir Central Command", layout="wide")
     st.title("Grandir Network Map")
@@ -433,9 +644,8 @@ def main():
     if 'data_revision' not in st.session_state:
         st.session_state['data_revision'] = 0
 
-    # Load Main Data
-    df_nurseries = load_nurseries_map_data(st.session_state['data_revision'])
-    
+    ensure_indexes()
+
     # Navigation
     st.sidebar.title("Navigation")
     view = st.sidebar.radio("Go to", ["Map View", "Global Candidates"])
@@ -453,76 +663,30 @@ def main():
             format_func=lambda x: x.capitalize()
         )
         
-        # Apply Filters
-        filtered_df = df_nurseries[df_nurseries['color'].isin(selected_colors)]
-        if show_apps_only:
-            filtered_df = filtered_df[filtered_df['application_count'] > 0]
-
         # Main Map
+        marker_rows = get_map_markers(tuple(sorted(selected_colors)), show_apps_only, st.session_state['data_revision'])
         m = folium.Map(location=PARIS_COORDS, zoom_start=DEFAULT_ZOOM)
-        for _, row in filtered_df.iterrows():
-            folium.Marker(
-                location=[row['latitude'], row['longitude']],
-                popup=f"<b>{row['nursery_name']}</b><br>Apps: {row['application_count']}",
-                tooltip=f"{row['nursery_name']} ({row['application_count']} apps)",
-                icon=folium.Icon(color=row['color'], icon='info-sign')
-            ).add_to(m)
+        # Markers are created client-side from the row list, in a single clustered layer
+        FastMarkerCluster(marker_rows, callback=NURSERY_MARKER_JS, name="Nurseries").add_to(m)
             
-        map_data = st_folium(m, width="100%", height=500)
+        # Only clicks are sent back, so panning and zooming the map no longer rerun the script
+        map_data = st_folium(m, width="100%", height=500, returned_objects=["last_object_clicked"])
 
         # Click Handling
         if map_data['last_object_clicked']:
             clicked_lat = map_data['last_object_clicked']['lat']
             clicked_lng = map_data['last_object_clicked']['lng']
             
-            # Find nursery by close coordinate match
-            match = df_nurseries[
-                (abs(df_nurseries['latitude'] - clicked_lat) < 0.0001) & 
-                (abs(df_nurseries['longitude'] - clicked_lng) < 0.0001)
-            ]
-            if not match.empty:
-                # We must use .item() to convert numpy int to native python int
-                selected_id = match.iloc[0]['nursery_id'].item()
-                if st.session_state['selected_nursery'] != selected_id:
-                    st.session_state['selected_nursery'] = selected_id
-                    st.rerun()
+            # Find nursery by its marker coordinates (the click returns the marker's exact position)
+            coord_index = get_nursery_coord_index(st.session_state['data_revision'])
+            selected_id = coord_index.get((round(clicked_lat, 4), round(clicked_lng, 4)))
+            if selected_id is not None and st.session_state['selected_nursery'] != selected_id:
+                st.session_state['selected_nursery'] = selected_id
+                st.rerun()
 
         # Nursery Detail Dashboard
         if st.session_state['selected_nursery']:
-            nursery_id = st.session_state['selected_nursery']
-            nursery_data = get_nursery_details(nursery_id)
-            
-            st.divider()
-            st.divider()
-            st.header(f"Recruitment Dashboard: {nursery_data['nursery_name']}")
-            
-            # Position Filter
-            active_roles = get_active_roles(nursery_id)
-            if active_roles.empty:
-                st.warning("No active job postings for this nursery.")
-            else:
-                role_options = {row['role_name']: row['role_id'] for _, row in active_roles.iterrows()}
-                selected_role_name = st.selectbox("Select Position", options=list(role_options.keys()))
-                selected_role_id = role_options[selected_role_name]
-                
-                # Candidate List
-                candidates = get_candidates_for_position(nursery_id, selected_role_id, st.session_state['data_revision'])
-                
-                if candidates.empty:
-                    st.info("No candidates found for this position.")
-                else:
-                    st.subheader(f"Candidates ({len(candidates)})")
-                    
-                    for _, cand in candidates.iterrows():
-                        # Pass context
-                        nursery_context = {
-                            'nursery_id': nursery_id,
-                            'nursery_name': nursery_data['nursery_name'],
-                            'latitude': nursery_data['latitude'],
-                            'longitude': nursery_data['longitude'],
-                            'role_id': selected_role_id # Pass role_id for Map View context
-                        }
-                        display_candidate_card(cand, nursery_context)
+            render_nursery_dashboard(st.session_state['selected_nursery'])
 
     # --- VIEW: Global List ---
     elif view == "Global Candidates":
@@ -538,7 +702,9 @@ def main():
         if all_candidates.empty:
             st.info("No active applications found.")
         else:
-            for _, cand in all_candidates.iterrows():
+            page = with_display_values(paginate(all_candidates, key="page_global"))
+            histories = get_application_histories(tuple(page['candidate_id'].tolist()), st.session_state['data_revision'])
+            for cand in page.to_dict('records'):
                 # For global list, we pass context from the row
                 nursery_context = {
                     'nursery_id': cand['nursery_id'],
@@ -546,7 +712,7 @@ def main():
                     'latitude': cand['nursery_lat'],
                     'longitude': cand['nursery_lon']
                 }
-                display_candidate_card(cand, nursery_context)
+                display_candidate_card(cand, nursery_context, histories[cand['candidate_id']])
 
 if __name__ == "__main__":
     main()